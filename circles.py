@@ -1,52 +1,405 @@
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 import math
+import numpy as np
 import pygame
 from pygame.locals import *
 import random
-import time
+
+try:
+    from numba import njit, prange
+except ImportError: # numba is optional; without it gravitate uses NumPy broadcasting
+    njit = None
+
+MIN_RADIUS = 7 # Smallest circle main places; sprites and stencils are made for every radius in between
+MAX_RADIUS = 13 # Largest circle main places
+BARNES_HUT_MIN = 256 # Below this many circles, exact pairwise gravitation is cheaper than a quadtree
+BARNES_HUT_THETA = 0.5 # Quadrants smaller than theta times their distance act as a single body
+QUADTREE_LEAF_SIZE = 4 # Maximum number of circles in a quadtree leaf
+QUADTREE_MAX_DEPTH = 32 # Circles sharing a position stop splitting at this depth
+RASTER_MIN = 1000 # From this many circles on, main draws through a pixel array instead of blitting sprites
+NUMPY_BLOCK_ROWS = 64 # Circles per block of the NumPy pair step; blocks run on separate threads
+
+_pool = ThreadPoolExecutor() # NumPy releases the GIL inside its array operations, so threads run blocks in parallel
 
 
 class Circle():
 
+    __slots__ = ('position', 'radius', 'velocity', 'glued') # no per-instance __dict__, for many small circles
+
     def __init__(self, position, radius):
         """
         Creates a circle object at the given position 
         and with the given radius
         """
-        self.position = position # The position of the circle
+        self.position = array('d', position) # The position of the circle
         self.radius = radius # The radius of the circle
-        self.velocity = [0, 0] # The velocity of the circle, in pixels per iteration
+        self.velocity = array('d', (0, 0)) # The velocity of the circle, in pixels per iteration
         self.glued = False # A glued circle does not move; circles glue when they collide
 
     def distance(self, other):
         """
         Returns the Euclidean distance between this circle and another
         """
-        return math.hypot(self.position[0] - other.position[0], self.position[0] - other.position[0])
+        dx = self.position[0] - other.position[0]
+        dy = self.position[1] - other.position[1]
+        return math.sqrt(dx * dx + dy * dy)
+
+
+class CircleArrays():
+
+    def __init__(self, circles, capacity=1024):
+        """
+        Stores the state of the given circles as parallel arrays,
+         with one row per circle, so the simulation can be vectorized
+        The arrays are allocated with room for `capacity` circles,
+         and double in size whenever they fill up
+        """
+        self.count = len(circles) # The number of circles in use; rows past this are free space
+        capacity = max(capacity, self.count)
+        self._positions = np.empty((capacity, 2), dtype=np.float64)
+        self._velocities = np.empty((capacity, 2), dtype=np.float64)
+        self._radii = np.empty(capacity, dtype=np.int64)
+        self._glued = np.empty(capacity, dtype=bool)
+        for i, c in enumerate(circles):
+            self._store(i, c)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def positions(self):
+        return self._positions[:self.count]
+
+    @property
+    def velocities(self):
+        return self._velocities[:self.count]
+
+    @property
+    def radii(self):
+        return self._radii[:self.count]
+
+    @property
+    def glued(self):
+        return self._glued[:self.count]
+
+    def _store(self, i, circle):
+        """
+        Writes a circle into row `i` of the arrays
+        """
+        self._positions[i] = circle.position
+        self._velocities[i] = circle.velocity
+        self._radii[i] = circle.radius
+        self._glued[i] = circle.glued
+
+    def append(self, circle):
+        """
+        Adds a circle to the end of the arrays
+        Doubles their capacity when they are full, so adding is amortized constant time
+        """
+        if self.count == len(self._radii):
+            capacity = max(2 * self.count, 1)
+            for name in ("_positions", "_velocities", "_radii", "_glued"):
+                old = getattr(self, name)
+                new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:self.count] = old[:self.count]
+                setattr(self, name, new)
+        self._store(self.count, circle)
+        self.count += 1
+
+    def unglue(self):
+        """
+        Sets `glued` to false for all circles
+        Also resets the velocity of those that were glued
+        """
+        self.velocities[self.glued] = 0
+        self.glued[:] = False
     
 
+def gravitate(positions, velocities, radii, glued, g_constant=0.1, time_step=1.0):
+    """
+    Vectorized form of `gravitate_glue`, acting on the arrays of a `CircleArrays`
+    Every pair is handled at once: colliding pairs become glued,
+     the rest attract by an inverse square law
+    Then all circles free to move do so in a single pass
+    `time_step` is the length of this step in iterations, so that motion
+     keeps its speed when frames run long or short
+    """
+    g_step = g_constant * time_step # velocity changes scale with the step just like g_constant
+    if _gravitate_kernel is not None:
+        if len(radii) >= BARNES_HUT_MIN:
+            _glue_grid(positions, radii, glued)
+            tree = _build_quadtree(positions, QUADTREE_LEAF_SIZE, QUADTREE_MAX_DEPTH)
+            _barnes_hut_kernel(positions, velocities, radii, glued, g_step, tree, BARNES_HUT_THETA)
+        else:
+            _gravitate_kernel(positions, velocities, radii, glued, g_step)
+    else:
+        n = len(radii)
+        blocks = [slice(k, min(k + NUMPY_BLOCK_ROWS, n)) for k in range(0, n, NUMPY_BLOCK_ROWS)]
+        if len(blocks) > 1:
+            list(_pool.map(lambda rows: _gravitate_rows(positions, velocities, radii, glued, g_step, rows), blocks))
+        elif blocks:
+            _gravitate_rows(positions, velocities, radii, glued, g_step, blocks[0])
+    if g_constant < 0:
+        positions += velocities * time_step
+    else:
+        positions += velocities * (time_step * ~glued[:, None])
+
+def _gravitate_rows(positions, velocities, radii, glued, g_step, rows):
+    """
+    NumPy pair step of `gravitate` for the circles in the slice `rows`, against all circles
+    Only those circles' velocities and glue flags are written,
+     so separate slices can be handled at the same time
+    """
+    d = positions[rows, None, :] - positions[None, :, :] # d[i, j] is the vector from circle j to circle rows.start + i
+    dist2 = (d * d).sum(-1)
+    dist2[np.arange(len(dist2)), np.arange(rows.start, rows.stop)] = np.inf # circles don't attract themselves
+    colliding = dist2 < (radii[rows, None] + radii[None, :]) ** 2
+    glued[rows] |= colliding.any(axis=1)
+    dist2[colliding] = np.inf # colliding pairs exert no force on each other
+    inv = g_step / (dist2 * np.sqrt(dist2))
+    velocities[rows] -= (inv[:, :, None] * d).sum(axis=1)
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _gravitate_kernel(positions, velocities, radii, glued, g_constant):
+        """
+        Compiled pairwise step of `gravitate`, without any N-by-N temporaries
+        Each circle only accumulates its own velocity and glue flag,
+         so the outer loop can be split across threads without races
+        """
+        for i in prange(len(radii)):
+            vxi = 0.0
+            vyi = 0.0
+            for j in range(len(radii)):
+                if i == j:
+                    continue
+                dx = positions[i, 0] - positions[j, 0]
+                dy = positions[i, 1] - positions[j, 1]
+                d2 = dx * dx + dy * dy
+                r = radii[i] + radii[j]
+                if d2 < r * r:
+                    glued[i] = True
+                    continue
+                inv = g_constant / (d2 * math.sqrt(d2))
+                vxi -= inv * dx
+                vyi -= inv * dy
+            velocities[i, 0] += vxi
+            velocities[i, 1] += vyi
+
+    @njit(cache=True)
+    def _build_quadtree(positions, leaf_size, max_depth):
+        """
+        Builds a quadtree over the circles, stored as flat arrays of nodes
+        Each node covers the slice `start:end` of the returned circle order,
+         and records its box centre, half width and centre of mass
+        Returns (order, start, end, child, centre, half, mass, centre_of_mass)
+        """
+        n = len(positions)
+        order = np.arange(n)
+        scratch = np.empty(n, np.int64)
+        capacity = 1 + 4 * max_depth * (n // (leaf_size + 1) + 1)
+        start = np.empty(capacity, np.int64)
+        end = np.empty(capacity, np.int64)
+        depth = np.empty(capacity, np.int64)
+        child = np.full((capacity, 4), -1, np.int64) # -1 marks an empty quadrant, all -1 marks a leaf
+        centre = np.empty((capacity, 2))
+        half = np.empty(capacity)
+        mass = np.empty(capacity)
+        centre_of_mass = np.empty((capacity, 2))
+        low_x = positions[:, 0].min()
+        low_y = positions[:, 1].min()
+        size = max(positions[:, 0].max() - low_x, positions[:, 1].max() - low_y) + 1.0
+        start[0] = 0
+        end[0] = n
+        depth[0] = 0
+        centre[0, 0] = low_x + size / 2
+        centre[0, 1] = low_y + size / 2
+        half[0] = size / 2
+        nodes = 1
+        stack = np.empty(capacity, np.int64)
+        stack[0] = 0
+        top = 1
+        while top > 0:
+            top -= 1
+            k = stack[top]
+            sx = 0.0
+            sy = 0.0
+            for s in range(start[k], end[k]):
+                sx += positions[order[s], 0]
+                sy += positions[order[s], 1]
+            mass[k] = end[k] - start[k]
+            centre_of_mass[k, 0] = sx / mass[k]
+            centre_of_mass[k, 1] = sy / mass[k]
+            if mass[k] <= leaf_size or depth[k] >= max_depth:
+                continue
+            # Sort the node's circles by quadrant, then give each non-empty quadrant a child
+            counts = np.zeros(4, np.int64)
+            for s in range(start[k], end[k]):
+                q = (positions[order[s], 0] >= centre[k, 0]) + 2 * (positions[order[s], 1] >= centre[k, 1])
+                counts[q] += 1
+            offsets = np.empty(4, np.int64)
+            offsets[0] = start[k]
+            for q in range(1, 4):
+                offsets[q] = offsets[q - 1] + counts[q - 1]
+            fill = offsets.copy()
+            for s in range(start[k], end[k]):
+                q = (positions[order[s], 0] >= centre[k, 0]) + 2 * (positions[order[s], 1] >= centre[k, 1])
+                scratch[fill[q]] = order[s]
+                fill[q] += 1
+            order[start[k]:end[k]] = scratch[start[k]:end[k]]
+            for q in range(4):
+                if counts[q] == 0:
+                    continue
+                start[nodes] = offsets[q]
+                end[nodes] = offsets[q] + counts[q]
+                depth[nodes] = depth[k] + 1
+                half[nodes] = half[k] / 2
+                centre[nodes, 0] = centre[k, 0] + (half[k] / 2 if q & 1 else -half[k] / 2)
+                centre[nodes, 1] = centre[k, 1] + (half[k] / 2 if q & 2 else -half[k] / 2)
+                child[k, q] = nodes
+                stack[top] = nodes
+                top += 1
+                nodes += 1
+        return (order, start[:nodes], end[:nodes], child[:nodes], centre[:nodes], half[:nodes],
+                mass[:nodes], centre_of_mass[:nodes])
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _barnes_hut_kernel(positions, velocities, radii, glued, g_constant, tree, theta):
+        """
+        Approximate pairwise step of `gravitate`, walking the quadtree from `_build_quadtree`
+        A quadrant far enough away, by `theta`, attracts as one body at its centre of mass,
+         unless it is close enough to hold a circle colliding with the current one
+        Leaves are handled exactly; colliding pairs there exert no force,
+         but glueing is left to `_glue_grid`
+        Each circle only writes its own row, so circles are split across threads
+        """
+        order, start, end, child, centre, half, mass, centre_of_mass = tree
+        max_radius = radii.max()
+        for i in prange(len(radii)):
+            xi = positions[i, 0]
+            yi = positions[i, 1]
+            reach = radii[i] + max_radius
+            vxi = 0.0
+            vyi = 0.0
+            stack = np.empty(4 * QUADTREE_MAX_DEPTH + 4, np.int64)
+            stack[0] = 0
+            top = 1
+            while top > 0:
+                top -= 1
+                k = stack[top]
+                if child[k, 0] + child[k, 1] + child[k, 2] + child[k, 3] == -4:
+                    for s in range(start[k], end[k]):
+                        j = order[s]
+                        if j == i:
+                            continue
+                        dx = xi - positions[j, 0]
+                        dy = yi - positions[j, 1]
+                        d2 = dx * dx + dy * dy
+                        r = radii[i] + radii[j]
+                        if d2 < r * r:
+                            continue
+                        inv = g_constant / (d2 * math.sqrt(d2))
+                        vxi -= inv * dx
+                        vyi -= inv * dy
+                    continue
+                dx = xi - centre_of_mass[k, 0]
+                dy = yi - centre_of_mass[k, 1]
+                d2 = dx * dx + dy * dy
+                gap_x = max(abs(xi - centre[k, 0]) - half[k], 0.0)
+                gap_y = max(abs(yi - centre[k, 1]) - half[k], 0.0)
+                if 4 * half[k] * half[k] < theta * theta * d2 and gap_x * gap_x + gap_y * gap_y >= reach * reach:
+                    inv = g_constant * mass[k] / (d2 * math.sqrt(d2))
+                    vxi -= inv * dx
+                    vyi -= inv * dy
+                    continue
+                for q in range(4):
+                    if child[k, q] >= 0:
+                        stack[top] = child[k, q]
+                        top += 1
+            velocities[i, 0] += vxi
+            velocities[i, 1] += vyi
+
+    @njit(parallel=True, cache=True)
+    def _glue_grid_kernel(positions, radii, glued, order, sorted_keys, key_cells, row_length):
+        """
+        Glues every circle that collides with another, using the grid built by `_glue_grid`
+        Each circle's 3 by 3 block of cells is three runs of consecutive keys,
+         so it is found with binary searches on the sorted keys
+        """
+        for i in prange(len(radii)):
+            for column in range(-1, 2):
+                key = key_cells[i] + column * row_length
+                low = np.searchsorted(sorted_keys, key - 1)
+                high = np.searchsorted(sorted_keys, key + 1, side='right')
+                for s in range(low, high):
+                    j = order[s]
+                    if j == i:
+                        continue
+                    dx = positions[i, 0] - positions[j, 0]
+                    dy = positions[i, 1] - positions[j, 1]
+                    r = radii[i] + radii[j]
+                    if dx * dx + dy * dy < r * r:
+                        glued[i] = True
+                        break
+                if glued[i]:
+                    break
+else:
+    _gravitate_kernel = None
+
+
+def _glue_grid(positions, radii, glued):
+    """
+    Glues colliding circles by bucketing them into a uniform grid
+    Cells are twice the largest radius wide, so any colliding pair
+     lies in the same cell or in neighbouring ones
+    """
+    cells = np.floor(positions / (2 * radii.max())).astype(np.int64)
+    cells -= cells.min(axis=0) - 1 # keeps neighbouring cells at non-negative, unambiguous keys
+    row_length = cells[:, 1].max() + 2
+    key_cells = cells[:, 0] * row_length + cells[:, 1]
+    order = np.lexsort((cells[:, 1], cells[:, 0]))
+    _glue_grid_kernel(positions, radii, glued, order, key_cells[order], key_cells, row_length)
+
+
 def gravitate_glue(circles, g_constant=0.1):
     """
     Applies gravitation to all circles, from all circles
     Works according to an inverse square law
     Colliding circles become glued, meaning they stop moving
     """
-    for i in range(len(circles)):
-        if g_constant < 0 or not circles[i].glued:
-            circles[i].position[0] += circles[i].velocity[0]
-            circles[i].position[1] += circles[i].velocity[1]
-        for j in range(i + 1, len(circles)):
-            dx = circles[i].position[0] - circles[j].position[0]
-            dy = circles[i].position[1] - circles[j].position[1]
-            distance = math.hypot(dx, dy)
-            if distance < circles[i].radius + circles[j].radius:
-                circles[i].glued = True
-                circles[j].glued = True
+    sqrt = math.sqrt # local names skip the global and attribute lookups in the inner loop
+    n = len(circles)
+    for i in range(n):
+        ci = circles[i]
+        vi = ci.velocity
+        if g_constant < 0 or not ci.glued:
+            ci.position[0] += vi[0]
+            ci.position[1] += vi[1]
+        pix, piy = ci.position
+        ri = ci.radius
+        dvxi = dvyi = 0.0 # changes to circle i's velocity, written back once after the inner loop
+        for j in range(i + 1, n):
+            cj = circles[j]
+            pjx, pjy = cj.position
+            dx = pix - pjx
+            dy = piy - pjy
+            d2 = dx * dx + dy * dy
+            if d2 < (ri + cj.radius) ** 2:
+                ci.glued = True
+                cj.glued = True
                 continue
-            force = g_constant / distance / distance
-            circles[i].velocity[0] -= force * dx / distance 
-            circles[i].velocity[1] -= force * dy / distance 
-            circles[j].velocity[0] += force * dx / distance 
-            circles[j].velocity[1] += force * dy / distance 
+            inv_d3 = g_constant / (d2 * sqrt(d2))
+            sx = inv_d3 * dx
+            sy = inv_d3 * dy
+            vj = cj.velocity
+            dvxi -= sx
+            dvyi -= sy
+            vj[0] += sx
+            vj[1] += sy
+        vi[0] += dvxi
+        vi[1] += dvyi
         
 
 def distribute_circles(number, radius_min, radius_max, x_bound, y_bound):
@@ -58,18 +411,15 @@ def distribute_circles(number, radius_min, radius_max, x_bound, y_bound):
     Furthermore, the boxes are spaced apart by an addition twice the maximal radius,
     so there are some empty boxes in the region
     """
-    bound_boxes = []
-    for i in range(x_bound / radius_max / 2):
-        for j in range(y_bound / radius_max / 2):
-            bound_boxes.append((2 * i * radius_max * 2, (2 * i + 1) * radius_max * 2, 2 * j * radius_max * 2, (2 * j + 1) * radius_max * 2))
-    #print(bound_boxes)
-    random.shuffle(bound_boxes)
-    circles = []
-    for i in range(min(number, len(bound_boxes))):
-        print(bound_boxes[i])
-        circles.append(Circle([random.randint(bound_boxes[i][0], bound_boxes[i][1]), random.randint(bound_boxes[i][2], bound_boxes[i][3])], 
-                random.randint(radius_min, radius_max)))
-    return circles
+    rng = np.random.default_rng()
+    nx = x_bound // (4 * radius_max)
+    ny = y_bound // (4 * radius_max)
+    box_x, box_y = np.mgrid[:nx, :ny].reshape(2, -1) * 4 * radius_max # lower corners of the boxes
+    boxes = rng.permutation(len(box_x))[:number]
+    xs = box_x[boxes] + rng.integers(0, 2 * radius_max, size=len(boxes), endpoint=True)
+    ys = box_y[boxes] + rng.integers(0, 2 * radius_max, size=len(boxes), endpoint=True)
+    radii = rng.integers(radius_min, radius_max, size=len(boxes), endpoint=True)
+    return [Circle([x, y], r) for x, y, r in zip(xs.tolist(), ys.tolist(), radii.tolist())]
 
 def place_boundary_circle(circles, x_bound, y_bound, x_margin, y_margin, min_radius, max_radius):
     """
@@ -98,9 +448,16 @@ def create_center_star(x_bound, y_bound, center_radius, outer_radius, sides):
      around it
     """
     circles = [Circle([x_bound / 2, y_bound / 2], center_radius)]
+    if sides <= 0:
+        return circles
+    spacing = center_radius + outer_radius
+    cos_step = math.cos(2 * math.pi / sides)
+    sin_step = math.sin(2 * math.pi / sides)
+    sin_angle, cos_angle = 0.0, 1.0
     for i in range(sides):
-        circles.append(Circle([x_bound / 2 + math.sin(i * 2 * math.pi / sides) * (center_radius + outer_radius), 
-                y_bound / 2 + math.cos(i * 2 * math.pi / sides) * (center_radius + outer_radius)], outer_radius))
+        circles.append(Circle([x_bound / 2 + sin_angle * spacing, y_bound / 2 + cos_angle * spacing], outer_radius))
+        # Rotate by one step: the angle addition formulas, without recomputing sin and cos
+        sin_angle, cos_angle = sin_angle * cos_step + cos_angle * sin_step, cos_angle * cos_step - sin_angle * sin_step
     return circles
 
 
@@ -113,16 +470,18 @@ def break_circles(circles, break_constant, time_skip=10):
     for i in range(len(circles)):
         if circles[i].glued:
             circles[i].glued = False
-            circles[i].velocity = [0, 0]
+            circles[i].velocity = array('d', (0, 0))
         for j in range(i + 1, len(circles)):
             dx = circles[i].position[0] - circles[j].position[0]
             dy = circles[i].position[1] - circles[j].position[1]
-            distance = math.hypot(dx, dy)
-            force = -break_constant / distance / distance
-            circles[i].velocity[0] = force * dx / distance 
-            circles[i].velocity[1] = force * dy / distance 
-            circles[j].velocity[0] = -force * dx / distance 
-            circles[j].velocity[1] = -force * dy / distance 
+            d2 = dx * dx + dy * dy
+            inv_d3 = -break_constant / (d2 * math.sqrt(d2))
+            sx = inv_d3 * dx
+            sy = inv_d3 * dy
+            circles[i].velocity[0] = sx
+            circles[i].velocity[1] = sy
+            circles[j].velocity[0] = -sx
+            circles[j].velocity[1] = -sy
     for c in circles:
         c.position[0] += time_skip * c.velocity[0]
         c.position[1] += time_skip * c.velocity[1]
@@ -135,7 +494,49 @@ def unglue(circles):
     for c in circles:
         if c.glued:
             c.glued = False
-            c.velocity = [0, 0]
+            c.velocity = array('d', (0, 0))
+
+
+def _make_circle_surface(radius):
+    """
+    Pre-renders a white circle of the given radius onto a transparent surface,
+     so drawing a circle each frame is a single blit
+    Must be called after the display mode is set
+    """
+    surface = pygame.Surface((2 * radius, 2 * radius), SRCALPHA)
+    pygame.draw.circle(surface, (255, 255, 255), (radius, radius), radius)
+    return surface.convert_alpha()
+
+
+def _make_circle_stencil(radius):
+    """
+    Returns the x and y offsets of the pixels covered by a circle of the given radius,
+     relative to the corner of its sprite, so raster drawing matches the sprites exactly
+    Must be called after the display mode is set
+    """
+    return np.nonzero(pygame.surfarray.array_alpha(_make_circle_surface(radius)))
+
+
+def draw_circles_raster(display, positions, radii, stencils):
+    """
+    Draws white circles on the grey background with a single blit
+    All circles of one radius are stamped into a coverage mask at once,
+     so there is no Python-level draw call per circle
+    """
+    width, height = display.get_size()
+    pad = 2 * max(stencils) # margin around the screen, so circles crossing an edge need no clipping
+    padded_height = height + 2 * pad
+    covered = np.zeros((width + 2 * pad) * padded_height, dtype=bool) # flattened [x, y] like pygame.surfarray
+    corners = positions.astype(np.int64) - radii[:, None] + pad
+    on_screen = ((corners[:, 0] > 0) & (corners[:, 0] < width + pad)
+                 & (corners[:, 1] > 0) & (corners[:, 1] < height + pad))
+    for radius, (stencil_x, stencil_y) in stencils.items():
+        group = corners[on_screen & (radii == radius)]
+        covered[(group[:, 0, None] * padded_height + group[:, 1, None]
+                 + stencil_x * padded_height + stencil_y).ravel()] = True
+    covered = covered.reshape(-1, padded_height)[pad:pad + width, pad:pad + height]
+    pixels = np.where(covered, display.map_rgb((255, 255, 255)), display.map_rgb((200, 200, 200)))
+    pygame.surfarray.blit_array(display, pixels.astype(np.uint32))
 
 
 def main():
@@ -148,13 +549,16 @@ def main():
     pygame.init()
 
     display = pygame.display.set_mode((500, 400))
+    sprites = {r: _make_circle_surface(r) for r in range(MIN_RADIUS, MAX_RADIUS + 1)}
+    stencils = {r: _make_circle_stencil(r) for r in sprites}
 
     #todo: make distribution scheme based on command line args
 
     #circles = distribute_circles(1353, 8, 12, 500, 400)
 
-    circles = create_center_star(500, 400, 13, 7, 5)
+    circles = CircleArrays(create_center_star(500, 400, MAX_RADIUS, MIN_RADIUS, 5))
     circle_tick = 200
+    clock = pygame.time.Clock()
 
     gravity = 0
 
@@ -165,15 +569,19 @@ def main():
         circle_tick += 1
         if circle_tick >= 100:
             circle_tick -= 100
-            place_boundary_circle(circles, 500, 400, 125, 100, 7, 13)
+            place_boundary_circle(circles, 500, 400, 125, 100, MIN_RADIUS, MAX_RADIUS)
 
         
 
-        gravitate(circles, gravities[gravity])
+        time_step = min(clock.get_time() * 60 / 1000, 4) # in 60 fps frames, capped so stalls can't fling circles
+        gravitate(circles.positions, circles.velocities, circles.radii, circles.glued, gravities[gravity], time_step)
 
-        display.fill((200, 200, 200))
-        for c in circles:
-            pygame.draw.circle(display, (255, 255, 255), (int(c.position[0]), int(c.position[1])), c.radius)
+        if len(circles) >= RASTER_MIN:
+            draw_circles_raster(display, circles.positions, circles.radii, stencils)
+        else:
+            display.fill((200, 200, 200))
+            for position, radius in zip(circles.positions, circles.radii):
+                display.blit(sprites[radius], (int(position[0]) - radius, int(position[1]) - radius))
 
         for event in pygame.event.get():
             if event.type == QUIT:
@@ -181,11 +589,11 @@ def main():
                 break
             if event.type == KEYDOWN:
                 if event.key == K_SPACE:
-                    unglue(circles)
+                    circles.unglue()
                     gravity = (gravity + 1) % len(gravities)
         
         pygame.display.update()
-        time.sleep(0.0167)
+        clock.tick(60)
 
 
 if __name__ == "__main__":